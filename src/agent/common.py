@@ -5,16 +5,25 @@
     """
 
 
+import hashlib
+import math
 import os
 import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, NamedTuple, Optional, Tuple
 
+import numpy as np
+import sqlalchemy
 from dotenv import load_dotenv
-from langchain_community.document_loaders import DirectoryLoader, TextLoader
 from langchain.schema import Document
+from langchain_core.embeddings import Embeddings
 from langchain_postgres.vectorstores import PGVector
 from langchain_google_genai.embeddings import GoogleGenerativeAIEmbeddings
+from pgvector.sqlalchemy import HALFVEC
 
 # Load environment variables
 load_dotenv()
@@ -27,6 +36,70 @@ if not GOOGLE_API_KEY:
 if not POSTGRES_CONNECTION_STRING:
     raise EnvironmentError("Missing POSTGRES_CONNECTION_STRING in environment variables.")
 
+# Support documents are stored in one collection per category, named "<prefix>_<category>"
+SUPPORT_DOCS_COLLECTION = "support_docs"
+
+# Embedding backend: "google" calls models/embedding-001, "fastembed" runs a local ONNX model.
+# Vectors of the two backends have different sizes, so switching requires a fresh vector table.
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "google").lower()
+FASTEMBED_MODEL = "BAAI/bge-small-en-v1.5"
+
+# Embedding size of the active backend; a fixed dimension is required to index the column
+EMBEDDING_DIMENSIONS = 384 if EMBEDDING_BACKEND == "fastembed" else 768
+# ANN index built on each collection after ingest: "hnsw" or "ivfflat"
+VECTOR_INDEX_METHOD = os.getenv("VECTOR_INDEX_METHOD", "hnsw").lower()
+# HNSW graph parameters and the memory allowed for building the graph
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 64
+INDEX_BUILD_MAINTENANCE_WORK_MEM = "2GB"
+# IVFFlat lists probed per query, applied to every connection of the shared stores
+IVFFLAT_PROBES = 10
+# Precision of the ANN index: "halfvec" indexes FP16 casts of the stored vectors (pgvector >= 0.7),
+# "vector" indexes the FP32 column directly
+VECTOR_INDEX_PRECISION = os.getenv("VECTOR_INDEX_PRECISION", "halfvec").lower()
+# Candidates fetched from the FP16 index per requested result, re-ranked with the FP32 vectors
+QUANTIZED_RERANK_FACTOR = 4
+# Hot categories served from an in-memory copy of their vectors; the others are searched in Postgres
+LOCAL_INDEX_CATEGORIES = frozenset(
+    category.strip().lower()
+    for category in os.getenv("LOCAL_INDEX_CATEGORIES", "billing,technical").split(",")
+    if category.strip()
+)
+
+# Process-local LRU of query embeddings, keyed by the SHA-256 of the normalized query text
+EMBED_CACHE_SIZE = 4096
+_embed_cache: "OrderedDict[str, Tuple[float, ...]]" = OrderedDict()
+_embed_cache_lock = threading.Lock()
+_embed_cache_hits = 0
+_embed_cache_misses = 0
+
+# Matches each "Entry N:" section of a dataset file, capturing its number and its text up to the next entry
+_ENTRY_RE = re.compile(r"\bEntry\s+(\d+):(.*?)(?=\bEntry\s+\d+:|\Z)", re.DOTALL)
+
+# In-memory copies of the hot categories' vectors, one entry per category. Loads happen under the
+# lock so concurrent misses read Postgres once, and invalidate_local_index() drops every entry.
+_local_indexes: Dict[str, Tuple[np.ndarray, List[Document]]] = {}
+_local_index_lock = threading.Lock()
+
+def _split_file(path: Path) -> List[Document]:
+    """Read one dataset file and split it into a Document per entry."""
+    source = str(path)
+    category = path.stem.lower()
+    full_text = path.read_text(encoding="utf-8")
+
+    return [
+        Document(
+            id=f"{category}-{match.group(1)}",
+            page_content=match.group(2).strip(),
+            metadata={
+                "category": category,
+                "entry": match.group(1),
+                "source": source,
+            }
+        )
+        for match in _ENTRY_RE.finditer(full_text)
+    ]
+
 def load_and_split_documents(dataset_path: str) -> List[Document]:
     """
     Load documents from directory and split them by entries labeled 'Entry N:'.
@@ -37,41 +110,350 @@ def load_and_split_documents(dataset_path: str) -> List[Document]:
     Returns:
         List of split Document objects with metadata.
     """
-    loader = DirectoryLoader(
-        dataset_path,
-        glob="**/*.txt",
-        loader_cls=TextLoader
+    paths = sorted(Path(dataset_path).rglob("*.txt"))
+    if not paths:
+        return []
+
+    # Reading is I/O bound, so overlap the files instead of loading them one by one
+    with ThreadPoolExecutor(max_workers=min(32, len(paths))) as executor:
+        per_file_docs = list(executor.map(_split_file, paths))
+
+    return [doc for docs in per_file_docs for doc in docs]
+
+def category_collection(category: str) -> str:
+    """Return the name of the PGVector collection holding a category's support documents."""
+    return f"{SUPPORT_DOCS_COLLECTION}_{category.lower()}"
+
+@lru_cache(maxsize=1)
+def get_embeddings() -> Embeddings:
+    """Return the embedding model of the configured backend, shared by ingest, the stores and queries."""
+    if EMBEDDING_BACKEND == "fastembed":
+        # Imported lazily so fastembed is only required when it is selected
+        from langchain_community.embeddings import FastEmbedEmbeddings
+
+        return FastEmbedEmbeddings(model_name=FASTEMBED_MODEL, batch_size=256)
+    return GoogleGenerativeAIEmbeddings(model="models/embedding-001")
+
+@lru_cache(maxsize=None)
+def get_vectorstore(
+    collection_name: str = SUPPORT_DOCS_COLLECTION,
+    connection_string: Optional[str] = None
+) -> PGVector:
+    """
+    Return a process-wide PGVector store for the given collection.
+
+    The store (and its embedding client and connection pool) is created on first use
+    and reused by every later call with the same arguments.
+
+    Args:
+        collection_name: Name of the PGVector collection.
+        connection_string: Postgres connection string (defaults to env variable).
+
+    Returns:
+        Shared PGVector store instance.
+    """
+    return PGVector.from_existing_index(
+        embedding=get_embeddings(),
+        collection_name=collection_name,
+        connection=connection_string or POSTGRES_CONNECTION_STRING,
+        embedding_length=EMBEDDING_DIMENSIONS,
+        engine_args={"connect_args": {"options": f"-c ivfflat.probes={IVFFLAT_PROBES}"}}
     )
-    raw_docs = loader.load()
-    split_docs = []
-
-    for doc in raw_docs:
-        source = doc.metadata.get("source", "")
-        category = Path(source).stem.lower()
-        full_text = doc.page_content
-
-        # Split text by "Entry N:"
-        entries = re.split(r"\bEntry\s+(\d+):", full_text)
-
-        # Skip intro (index 0) and process entries
-        for i in range(1, len(entries), 2):
-            entry_num = entries[i]
-            entry_text = entries[i + 1].strip()
-
-            split_docs.append(
-                Document(
-                    page_content=entry_text,
-                    metadata={
-                        "category": category,
-                        "entry": entry_num,
-                        "source": source,
-                    }
-                )
-            )
-    return split_docs
+
+class EmbedCacheInfo(NamedTuple):
+    """Hit/miss statistics of the query embedding cache."""
+
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+def embed_cache_info() -> EmbedCacheInfo:
+    """Return hit/miss statistics of the query embedding cache, like functools' cache_info()."""
+    with _embed_cache_lock:
+        return EmbedCacheInfo(_embed_cache_hits, _embed_cache_misses, EMBED_CACHE_SIZE, len(_embed_cache))
+
+def _normalize_query(text: str) -> str:
+    """Fold case and whitespace so trivially different phrasings share a cache entry."""
+    return " ".join(text.lower().split())
+
+def _get_cached_embedding(key: str) -> Optional[List[float]]:
+    """Return the cached embedding for a digest, marking it as recently used."""
+    global _embed_cache_hits, _embed_cache_misses
+    with _embed_cache_lock:
+        cached = _embed_cache.get(key)
+        if cached is None:
+            _embed_cache_misses += 1
+            return None
+        _embed_cache_hits += 1
+        _embed_cache.move_to_end(key)
+        return list(cached)
+
+def _set_cached_embedding(key: str, vector: List[float]) -> None:
+    """Store an embedding for a digest, evicting the least recently used entry."""
+    with _embed_cache_lock:
+        _embed_cache[key] = tuple(vector)
+        if len(_embed_cache) > EMBED_CACHE_SIZE:
+            _embed_cache.popitem(last=False)
+
+def ingest_documents(
+    docs: List[Document],
+    collection_name: str = SUPPORT_DOCS_COLLECTION,
+    batch_size: int = 100
+) -> None:
+    """
+    Embed documents in batches and upsert them into a PGVector collection.
+
+    Each batch is embedded with a single embed_documents call and written with
+    add_embeddings, so documents with a stable id are updated instead of duplicated.
+
+    Args:
+        docs: Documents to ingest.
+        collection_name: Name of the PGVector collection.
+        batch_size: Number of documents embedded per request.
+    """
+    vectorstore = get_vectorstore(collection_name)
+    for start in range(0, len(docs), batch_size):
+        batch = docs[start:start + batch_size]
+        texts = [doc.page_content for doc in batch]
+        vectorstore.add_embeddings(
+            texts=texts,
+            embeddings=vectorstore.embeddings.embed_documents(texts),
+            metadatas=[doc.metadata for doc in batch],
+            ids=[doc.id for doc in batch],
+        )
+
+def create_vector_index(collection_name: str = SUPPORT_DOCS_COLLECTION, method: Optional[str] = None) -> None:
+    """
+    Create a partial ANN cosine index covering only the rows of one collection.
+
+    Scoping the index to the collection means a search only visits vectors of that collection.
+    HNSW is built with m=16 / ef_construction=64; IVFFlat sizes its lists to roughly the square
+    root of the collection's row count. With VECTOR_INDEX_PRECISION="halfvec" the index is built
+    on FP16 casts of the vectors, halving its size; see quantized_similarity_search. The statement
+    is a no-op if the index already exists.
+
+    Args:
+        collection_name: Name of the PGVector collection to index.
+        method: "hnsw" or "ivfflat" (defaults to VECTOR_INDEX_METHOD).
+
+    Raises:
+        ValueError: If the index method or precision is not supported.
+    """
+    method = (method or VECTOR_INDEX_METHOD).lower()
+    if method not in ("hnsw", "ivfflat"):
+        raise ValueError(f"Unsupported vector index method: {method}")
+    if VECTOR_INDEX_PRECISION == "halfvec":
+        indexed = f"(embedding::halfvec({EMBEDDING_DIMENSIONS})) halfvec_cosine_ops"
+        suffix = "halfvec_idx"
+    elif VECTOR_INDEX_PRECISION == "vector":
+        indexed = "embedding vector_cosine_ops"
+        suffix = "idx"
+    else:
+        raise ValueError(f"Unsupported vector index precision: {VECTOR_INDEX_PRECISION}")
+
+    vectorstore = get_vectorstore(collection_name)
+    index_name = re.sub(r"\W", "_", f"{collection_name}_{method}_{suffix}")
+    with vectorstore.session_maker() as session:
+        collection = vectorstore.get_collection(session)
+        if not collection:
+            return
+
+        if method == "hnsw":
+            params = f"m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION}"
+        else:
+            row_count = (
+                session.query(sqlalchemy.func.count(vectorstore.EmbeddingStore.id))
+                .filter(vectorstore.EmbeddingStore.collection_id == collection.uuid)
+                .scalar()
+            ) or 0
+            params = f"lists = {max(1, int(math.sqrt(row_count)))}"
+
+        session.execute(sqlalchemy.text(
+            f"SET LOCAL maintenance_work_mem = '{INDEX_BUILD_MAINTENANCE_WORK_MEM}'"
+        ))
+        session.execute(sqlalchemy.text(
+            f"CREATE INDEX IF NOT EXISTS {index_name} "
+            f"ON langchain_pg_embedding USING {method} ({indexed}) "
+            f"WITH ({params}) WHERE collection_id = '{collection.uuid}'"
+        ))
+        session.commit()
+
+def embed_query(text: str) -> List[float]:
+    """
+    Embed a query, reusing the result for text that was embedded before.
+
+    The text is lower-cased and its whitespace collapsed before it is embedded and cached.
+
+    Args:
+        text: Query text to embed.
+
+    Returns:
+        Embedding vector for the text.
+    """
+    text = _normalize_query(text)
+    key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    cached = _get_cached_embedding(key)
+    if cached is not None:
+        return cached
+
+    vector = get_embeddings().embed_query(text)
+    _set_cached_embedding(key, vector)
+    return list(vector)
+
+async def aembed_query(text: str) -> List[float]:
+    """
+    Async version of embed_query, sharing the same cache.
+
+    Args:
+        text: Query text to embed.
+
+    Returns:
+        Embedding vector for the text.
+    """
+    text = _normalize_query(text)
+    key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    cached = _get_cached_embedding(key)
+    if cached is not None:
+        return cached
+
+    vector = await get_embeddings().aembed_query(text)
+    _set_cached_embedding(key, vector)
+    return list(vector)
+
+def quantized_similarity_search(
+    embedding: List[float],
+    collection_name: str = SUPPORT_DOCS_COLLECTION,
+    k: int = 5
+) -> List[Document]:
+    """
+    Search a collection through its FP16 index and re-rank the candidates at full precision.
+
+    The ANN scan orders by the cosine distance of the halfvec casts, which matches the index built
+    by create_vector_index, and fetches QUANTIZED_RERANK_FACTOR * k candidates. Their stored FP32
+    vectors are then scored exactly, so the quantization only affects which candidates are seen.
+
+    Args:
+        embedding: Query embedding.
+        collection_name: Name of the PGVector collection to search.
+        k: Number of documents to return.
+
+    Returns:
+        List of the most similar documents, best match first.
+    """
+    vectorstore = get_vectorstore(collection_name)
+    store = vectorstore.EmbeddingStore
+    query = np.asarray(embedding, dtype=np.float32)
+    halfvec = HALFVEC(EMBEDDING_DIMENSIONS)
+    with vectorstore.session_maker() as session:
+        collection = vectorstore.get_collection(session)
+        if not collection:
+            return []
+        distance = sqlalchemy.cast(store.embedding, halfvec).cosine_distance(
+            sqlalchemy.cast(query.tolist(), halfvec)
+        )
+        rows = (
+            session.query(store)
+            .filter(store.collection_id == collection.uuid)
+            .order_by(distance)
+            .limit(k * QUANTIZED_RERANK_FACTOR)
+            .all()
+        )
+
+    return _rerank_rows(rows, query, k)
+
+def _rerank_rows(rows: list, query: np.ndarray, k: int) -> List[Document]:
+    """Order embedding rows by exact FP32 cosine similarity to the query and keep the top k."""
+    if not rows:
+        return []
+
+    candidates = np.asarray([row.embedding for row in rows], dtype=np.float32)
+    scores = candidates @ query / (
+        np.linalg.norm(candidates, axis=1) * max(float(np.linalg.norm(query)), 1e-12)
+    ).clip(min=1e-12)
+    top = np.argsort(-scores)[:k]
+    return [
+        Document(id=str(rows[i].id), page_content=rows[i].document, metadata=rows[i].cmetadata)
+        for i in top
+    ]
+
+def invalidate_local_index() -> None:
+    """Drop the in-memory category indexes so they are rebuilt on next use."""
+    with _local_index_lock:
+        _local_indexes.clear()
+
+def _get_local_index(category: str) -> Tuple[np.ndarray, List[Document]]:
+    """Return a category's in-memory index, loading it from Postgres on first use."""
+    with _local_index_lock:
+        index = _local_indexes.get(category)
+        if index is None:
+            index = _local_indexes[category] = _load_local_index(category)
+        return index
+
+def _load_local_index(category: str) -> Tuple[np.ndarray, List[Document]]:
+    """
+    Load every embedding of a category's collection into a normalized in-memory matrix.
+
+    Args:
+        category: Ticket category whose documents should be loaded.
+
+    Returns:
+        Tuple of the (n_docs, dim) float32 matrix of unit vectors and the matching documents.
+    """
+    vectorstore = get_vectorstore(category_collection(category))
+    store = vectorstore.EmbeddingStore
+    with vectorstore.session_maker() as session:
+        collection = vectorstore.get_collection(session)
+        if not collection:
+            return np.empty((0, 0), dtype=np.float32), []
+        rows = (
+            session.query(store)
+            .filter(store.collection_id == collection.uuid)
+            .all()
+        )
+
+    if not rows:
+        return np.empty((0, 0), dtype=np.float32), []
+
+    matrix = np.ascontiguousarray([row.embedding for row in rows], dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True).clip(min=1e-12)
+    docs = [
+        Document(id=str(row.id), page_content=row.document, metadata=row.cmetadata)
+        for row in rows
+    ]
+    return matrix, docs
+
+def local_similarity_search(embedding: List[float], category: str, k: int = 5) -> List[Document]:
+    """
+    Return the k documents of a category closest to the embedding by cosine similarity.
+
+    The search runs against an in-memory copy of the category's vectors, which is loaded
+    from Postgres on first use. Only categories in LOCAL_INDEX_CATEGORIES are kept in memory;
+    an empty list means the category has no local index and should be searched in Postgres.
+
+    Args:
+        embedding: Query embedding.
+        category: Ticket category to search in.
+        k: Number of documents to return.
+
+    Returns:
+        List of the most similar documents, best match first.
+    """
+    if category.lower() not in LOCAL_INDEX_CATEGORIES:
+        return []
+    matrix, docs = _get_local_index(category.lower())
+    if not docs:
+        return []
+
+    query = np.asarray(embedding, dtype=np.float32)
+    scores = matrix @ (query / max(float(np.linalg.norm(query)), 1e-12))
+    k = min(k, len(docs))
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top])]
+    return [docs[i] for i in top]
 
 def make_pgvector_retriever(
-    collection_name: str = "support_docs",
+    collection_name: str = SUPPORT_DOCS_COLLECTION,
     connection_string: Optional[str] = None,
     search_kwargs: Optional[Dict] = None
 ) -> PGVector:
@@ -95,18 +477,12 @@ def make_pgvector_retriever(
     if not isinstance(search_kwargs, dict):
         raise TypeError(f"Expected 'search_kwargs' to be a dict but got {type(search_kwargs).__name__}")
 
-    embedding_model = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-
     try:
-        vectorstore = PGVector.from_existing_index(
-            embedding=embedding_model,
-            collection_name=collection_name,
-            connection=connection_string
-        )
+        vectorstore = get_vectorstore(collection_name, connection_string)
     except Exception as e:
         raise RuntimeError(f"Failed to initialize PGVector retriever: {e}")
 
     try:
         return vectorstore.as_retriever(search_kwargs=search_kwargs)
     except Exception as e:
-        raise RuntimeError(f"Failed to get retriever from PGVector: {e}")
\ No newline at end of file
+        raise RuntimeError(f"Failed to get retriever from PGVector: {e}")
@@ -1,35 +1,335 @@
 import asyncio
+import csv
 import datetime
-import os
+import hashlib
+import logging
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 
-import pandas as pd
 from dotenv import load_dotenv
-from langchain.prompts import PromptTemplate
 from langchain.schema import Document
 from langchain_core.runnables import RunnableLambda
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_postgres.vectorstores import PGVector
 from langgraph.graph import StateGraph, START
 
-from agent.prompts import (
-    CLASSIFICATION_PROMPT,
-    DRAFT_RESPONSE_PROMPT,
-    REVIEW_DRAFT_PROMPT
-)
+from agent.prompts import CLASSIFICATION_TPL, DRAFT_RESPONSE_TPL, REVIEW_DRAFT_TPL
 from agent.state import State
-from agent.schemas import Classification, ReviewResult, Input, Output
-from agent.common import make_pgvector_retriever, POSTGRES_CONNECTION_STRING
+from agent.schemas import CATEGORIES, Classification, ReviewResult, Input, Output
+from agent.common import (
+    aembed_query,
+    embed_query,
+    category_collection,
+    get_vectorstore,
+    local_similarity_search,
+    quantized_similarity_search,
+    POSTGRES_CONNECTION_STRING,
+    VECTOR_INDEX_PRECISION
+)
 from agent.utils import refresh_rag, get_llm
 
+logger = logging.getLogger(__name__)
+
 # === Load environment variables ===
 load_dotenv()
 
 if not POSTGRES_CONNECTION_STRING:
     raise EnvironmentError("Missing POSTGRES_CONNECTION_STRING in .env or environment.")
 
+# Collection holding approved responses, the cosine similarity needed to reuse one and how long
+# a cached response stays valid, so answers follow knowledge base updates
+RESPONSE_CACHE_COLLECTION = "response_cache"
+SEMANTIC_CACHE_THRESHOLD = 0.95
+SEMANTIC_CACHE_MAX_AGE = datetime.timedelta(days=7)
+
+# Upper bound on documents passed to the draft once keyword results are merged in
+MAX_CONTEXT_DOCS = 8
+# Character budgets for reference text in the draft prompt (roughly 512 / 2048 tokens)
+MAX_CHARS_PER_DOC = 2000
+MAX_CONTEXT_CHARS = 8000
+# Older review feedback is folded into a summary capped at this many characters for the draft prompt
+MAX_FEEDBACK_SUMMARY_CHARS = 500
+
+# Tickets whose retrieved documents are kept in memory at once; older entries are evicted
+MAX_TRACKED_TICKETS = 1024
+
+
+class _TicketDocs(OrderedDict):
+    """Documents per trace_id that evicts the oldest tickets beyond MAX_TRACKED_TICKETS."""
+
+    def __setitem__(self, key: str, value: List[Document]) -> None:
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        while len(self) > MAX_TRACKED_TICKETS:
+            self.popitem(last=False)
+
+
+# Retrieved documents are kept out of the graph state, keyed by the ticket's trace_id, so they
+# are never copied between nodes or written to checkpoints. rag_node writes them, generate_draft
+# consumes the per-round context and format_output releases whatever is left. The maps are bounded
+# so runs that are cancelled or fail before format_output can't hold their documents forever.
+_BASE_DOCS: Dict[str, List[Document]] = _TicketDocs()
+_CONTEXT_DOCS: Dict[str, List[Document]] = _TicketDocs()
+
+# === Chains ===
+# The precompiled prompt templates and structured-output bindings are composed once at import time
+# and shared by every ticket. The static instructions go in the system message and the ticket fields
+# in the human message, so every request starts with the same prefix for provider prompt caching.
+
+_LLM = get_llm()
+_CLASSIFY_CHAIN = CLASSIFICATION_TPL | _LLM.with_structured_output(Classification)
+_DRAFT_CHAIN = DRAFT_RESPONSE_TPL | _LLM
+_REVIEW_CHAIN = REVIEW_DRAFT_TPL | _LLM.with_structured_output(ReviewResult)
+
+# Lexical cues that identify a category without the LLM. A ticket matching exactly one category
+# is classified directly; tickets matching none or several are left to the classifier chain.
+_FAST_CATEGORY_PATTERNS = [
+    (re.compile(r"\b(refunds?|charged|charges?|invoices?|billing|billed|payments?|paid)\b", re.IGNORECASE), "billing"),
+    (re.compile(r"\b(crash\w*|errors?|bugs?|freez\w*|not loading|upload\w*)\b", re.IGNORECASE), "technical"),
+    (re.compile(r"\b(suspicious|passwords?|hack\w*|phishing|unauthori[sz]ed|compromised|2fa)\b", re.IGNORECASE), "security"),
+]
+
+# Review rounds after which a still-rejected ticket is dumped for a human
+_MAX_REVIEWS = 2
+
+# The dataset is ingested once per process; a failed ingest is retried after this many seconds
+RAG_INDEX_RETRY_SECONDS = 60
+_rag_index_lock = threading.Lock()
+_rag_index_ready = False
+_rag_index_failed_at: Optional[float] = None
+
+# Columns of the rejected tickets CSV
+REJECTED_TICKETS_FIELDS = ["timestamp", "subject", "description", "category", "drafts", "feedbacks"]
+_rejected_tickets_lock = threading.Lock()
+
+# === Helpers ===
+
+
+def _ensure_rag_index() -> None:
+    """
+    Index the dataset once per process instead of on every retrieval.
+
+    Tickets arriving together at cold start wait on the lock for a single ingest. A failed ingest
+    is not retried until RAG_INDEX_RETRY_SECONDS have passed, so an outage doesn't re-run it for
+    every ticket.
+
+    Raises:
+        RuntimeError: If the last ingest failed less than RAG_INDEX_RETRY_SECONDS ago.
+    """
+    global _rag_index_ready, _rag_index_failed_at
+    if _rag_index_ready:
+        return
+    with _rag_index_lock:
+        if _rag_index_ready:
+            return
+        if _rag_index_failed_at is not None and time.monotonic() - _rag_index_failed_at < RAG_INDEX_RETRY_SECONDS:
+            raise RuntimeError("Dataset ingest failed recently, not retrying yet.")
+        try:
+            refresh_rag()
+        except Exception:
+            _rag_index_failed_at = time.monotonic()
+            raise
+        _rag_index_ready = True
+
+
+def _try_ensure_rag_index() -> None:
+    """Run _ensure_rag_index, only logging a failure so retrieval can use collections from an earlier run."""
+    try:
+        _ensure_rag_index()
+    except Exception as e:
+        logger.warning("Dataset ingest unavailable, searching the existing collections: %s", e)
+
+
+def _ticket_text(state: State) -> str:
+    """Return the text used to embed a ticket for the semantic cache."""
+    return f"{state['subject']} {state['description']}"
+
+
+def _store_cached_response(state: State, message: str) -> None:
+    """Upsert an approved response into the semantic cache, keyed by the ticket embedding."""
+    ticket_text = _ticket_text(state)
+    vectorstore = get_vectorstore(RESPONSE_CACHE_COLLECTION)
+    vectorstore.add_embeddings(
+        texts=[ticket_text],
+        # Served from the query embedding cache filled by semantic_cache_lookup
+        embeddings=[embed_query(ticket_text)],
+        metadatas=[{
+            "message": message,
+            "category": state.get('category'),
+            "ts": datetime.datetime.now().isoformat(),
+        }],
+        ids=[hashlib.sha256(ticket_text.encode("utf-8")).hexdigest()],
+    )
+
+
+def _append_rejected_ticket(filepath: str, row: list) -> None:
+    """Append one row to the rejected tickets CSV, writing the header if the file is empty."""
+    path = Path(filepath)
+    # Appends from concurrent dumps are serialized so the header is written exactly once
+    with _rejected_tickets_lock:
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+
+        # One buffered append per ticket; the row is handed to the OS in a single write on close
+        with open(path, "a", newline="", encoding="utf-8", buffering=65536) as f:
+            writer = csv.writer(f, lineterminator="\n")
+            if f.tell() == 0:
+                writer.writerow(REJECTED_TICKETS_FIELDS)
+            writer.writerow(row)
+
+
+def _fast_classify(text: str) -> Optional[Tuple[str, List[str]]]:
+    """Return the category and matched cues if the text matches exactly one category pattern."""
+    matches = [
+        (category, matched)
+        for pattern, category in _FAST_CATEGORY_PATTERNS
+        if (matched := pattern.findall(text))
+    ]
+    if len(matches) != 1:
+        return None
+    category, matched = matches[0]
+    return category, list(dict.fromkeys(word.lower() for word in matched))
+
+
+def _record_feedback(state: State, feedback: str) -> None:
+    """
+    Make feedback the latest review feedback, folding the previous one into the summary.
+
+    The full history stays in 'feedback' for the rejected tickets CSV, while the draft prompt only
+    sees 'latest_feedback' and the bounded 'prior_feedback_summary'.
+    """
+    previous = state.get("latest_feedback")
+    if previous:
+        summary = " | ".join(filter(None, [state.get("prior_feedback_summary"), previous]))
+        # Keep the most recent end of the summary when it outgrows its budget
+        state["prior_feedback_summary"] = summary[-MAX_FEEDBACK_SUMMARY_CHARS:]
+    state["latest_feedback"] = feedback
+    state.setdefault("feedback", []).append(feedback)
+
+
+def _feedback_for_prompt(state: State) -> str:
+    """Return the review feedback passed to the draft prompt: the latest one plus the summary."""
+    latest = state.get("latest_feedback") or ""
+    summary = state.get("prior_feedback_summary")
+    if summary:
+        return f"{latest}\nEarlier feedback: {summary}"
+    return latest
+
+
+def _trace_id(state: State) -> str:
+    """Return the id used to find the ticket's documents, assigning one on first use."""
+    if not state.get('trace_id'):
+        state['trace_id'] = str(uuid.uuid4())
+    return state['trace_id']
+
+
+def _compact_context(
+    docs: List[Document],
+    per_doc_chars: int = MAX_CHARS_PER_DOC,
+    total_chars: int = MAX_CONTEXT_CHARS
+) -> str:
+    """Join document texts for the draft prompt, skipping duplicates and capping their length."""
+    seen = set()
+    snippets = []
+    budget = total_chars
+    for doc in docs:
+        if doc.page_content in seen:
+            continue
+        seen.add(doc.page_content)
+        snippet = doc.page_content[:min(per_doc_chars, budget)]
+        if not snippet:
+            break
+        snippets.append(snippet)
+        budget -= len(snippet)
+    return "\n\n".join(snippets)
+
+
+def _nearest_cached_ticket(query_embedding: List[float]) -> List[Tuple[Document, float]]:
+    """Return the closest response cache entry and its cosine distance; runs in a worker thread."""
+    vectorstore = get_vectorstore(RESPONSE_CACHE_COLLECTION)
+    return vectorstore.similarity_search_with_score_by_vector(query_embedding, k=1)
+
+
+def _pgvector_search(query_embedding: List[float], category: str, k: int) -> List[Document]:
+    """Search a category's collection in PGVector; runs in a worker thread."""
+    return get_vectorstore(category_collection(category)).similarity_search_by_vector(query_embedding, k=k)
+
+
+async def _search_category(query_embedding: List[float], category: str, k: int = 5) -> List[Document]:
+    """Return the k closest documents of a category: in memory for hot categories, else from PGVector."""
+    try:
+        docs = await asyncio.to_thread(local_similarity_search, query_embedding, category, k)
+    except Exception as e:
+        logger.warning("Local index unavailable, falling back to PGVector: %s", e)
+        docs = []
+    if docs:
+        return docs
+    if VECTOR_INDEX_PRECISION == "halfvec":
+        try:
+            return await asyncio.to_thread(
+                quantized_similarity_search, query_embedding, category_collection(category), k
+            )
+        except Exception as e:
+            # e.g. pgvector < 0.7 has no halfvec type
+            logger.warning("Quantized search failed, falling back to the FP32 search: %s", e)
+    return await asyncio.to_thread(_pgvector_search, query_embedding, category, k)
+
+
+async def _recover_context_docs(state: State) -> List[Document]:
+    """Retrieve documents for the ticket text when rag_node's entry is gone (evicted, other worker)."""
+    logger.warning("No retrieved documents for trace_id %s, searching again", state.get('trace_id'))
+    try:
+        query_embedding = await aembed_query(_ticket_text(state))
+        docs = await _search_category(query_embedding, (state.get('category') or 'general').lower())
+    except Exception as e:
+        logger.error("Error while retrieving documents for the draft: %s", e)
+        docs = []
+    return docs or [Document(page_content="No relevant documents found.")]
+
+
 # === Nodes ===
 
 
+async def semantic_cache_lookup(state: State) -> State:
+    """This function looks up a previously approved response for a near-duplicate ticket.
+
+    It embeds the subject and description once, searches the response cache collection for
+    the closest stored ticket and, if its cosine similarity reaches SEMANTIC_CACHE_THRESHOLD,
+    stores the cached message in 'cached_response' so the graph can skip straight to the output.
+    Responses cached more than SEMANTIC_CACHE_MAX_AGE ago are ignored.
+    The embedding stays in the query embedding cache, so storing the approved answer later
+    doesn't embed the ticket again.
+
+    Args:
+        state (State): The current state of the support ticket, which includes 'subject' and 'description'.
+
+    Returns:
+        State: The updated state with 'cached_response'.
+    """
+    state['cached_response'] = None
+    try:
+        query_embedding = await aembed_query(_ticket_text(state))
+        # The store is looked up in the worker thread too, since creating it connects to Postgres
+        results = await asyncio.to_thread(_nearest_cached_ticket, query_embedding)
+        # PGVector returns cosine distance, so similarity is 1 - distance
+        if results and 1 - results[0][1] >= SEMANTIC_CACHE_THRESHOLD:
+            cached_doc = results[0][0]
+            cached_ts = cached_doc.metadata.get("ts")
+            cached_at = datetime.datetime.fromisoformat(cached_ts) if cached_ts else datetime.datetime.min
+            if datetime.datetime.now() - cached_at <= SEMANTIC_CACHE_MAX_AGE:
+                state['cached_response'] = cached_doc.metadata.get("message")
+                logger.info("Semantic cache hit")
+            else:
+                logger.info("Semantic cache entry expired")
+    except Exception as e:
+        logger.error("Error during semantic cache lookup: %s", e)
+    return state
+
+
+
 async def classify_ticket(state: State) -> State:
     """This function classifies the support ticket based on its subject and description.
 
@@ -39,7 +339,10 @@ async def classify_ticket(state: State) -> State:
     - Security
     - General
 
-    The classification is stored in the 'category' field of the state.
+    The classification is stored in the 'category' field of the state. The same call also returns
+    a few intent keywords, stored in 'intent_keywords', which rag_node adds to its first query.
+    Tickets whose wording points at exactly one category are classified by keyword patterns
+    without calling the language model; the matched words become the intent keywords.
 
     Args:
         state (State): The current state of the support ticket, which includes 'subject' and 'description'.
@@ -52,36 +355,41 @@ async def classify_ticket(state: State) -> State:
         State: The updated state with the classified category.
     """
     try:
-        print("Invoking classifier LLM")
-        llm = get_llm()
-
         if 'subject' not in state or 'description' not in state:
             raise ValueError("State must contain both 'subject' and 'description' keys.")
         if not state['subject'] or not state['description']:
             raise ValueError("Subject and description must not be empty.")
 
-        structured_llm = llm.with_structured_output(Classification)
-        prompt = PromptTemplate.from_template(CLASSIFICATION_PROMPT)
-        prompt_value = prompt.invoke({
+        fast_result = _fast_classify(_ticket_text(state))
+        if fast_result is not None:
+            state['category'], state['intent_keywords'] = fast_result
+            logger.info("Ticket classified as: %s (keyword match)", state['category'])
+            return state
+
+        logger.info("Invoking classifier LLM")
+        classification_output = await _CLASSIFY_CHAIN.ainvoke({
             'subject': str(state['subject']),
             'description': str(state['description'])
         })
-        classification_output = structured_llm.invoke(prompt_value)
-        if classification_output.output not in ['billing', 'technical', 'security', 'general']:
-            raise ValueError(f"Unexpected classification result: {classification_output.output}")
-        state['category'] = classification_output.output
+        category = classification_output.output.strip().lower()
+        if category not in CATEGORIES:
+            logger.warning("Unexpected classification result %r, defaulting to 'general'", classification_output.output)
+            category = 'general'
+        state['category'] = category
+        state['intent_keywords'] = classification_output.intent_keywords or []
     except Exception as e:
-        print(f"Error during classification: {e}")
+        logger.error("Error during classification: %s", e)
         state['category'] = 'general'
+        state['intent_keywords'] = []
 
-    print(f"Ticket classified as: {state['category']}")
+    logger.info("Ticket classified as: %s", state['category'])
     return state
 
 async def rag_node(state: State) -> State:
     """This function retrieves relevant documents from the vector store based on the ticket's subject and description.
 
     It uses the PGVector vector store to find documents that match the category of the ticket.
-    The retrieved documents are stored in the 'context_docs' field of the state.
+    The retrieved documents are stored outside the state under the ticket's 'trace_id'.
 
     Note: This function assumes that the vector store has been properly initialized and contains relevant documents.
 
@@ -95,39 +403,51 @@ async def rag_node(state: State) -> State:
         State: 
     """
     try:
-        print(f"Running RAG node for state: {state}")
-        refresh_rag()  # Ensure the vector store is refreshed before retrieval all the embeddings are up to date
+        logger.debug("Running RAG node for state keys: %s", list(state.keys()))
 
         if 'subject' not in state or 'description' not in state or 'category' not in state:
             raise ValueError("State must contain 'subject', 'description', and 'category' keys.")
 
-        embedding_model = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-
-        vectorstore = PGVector.from_existing_index(
-            embedding=embedding_model,
-            collection_name="support_docs",
-            connection=POSTGRES_CONNECTION_STRING,
-        )
-        
-
-        # Construct the query using subject, description, and retrive_improve keywords
-        query = f"{state['subject']} {state['description']} {state.get('retrive_improve',[])}".strip()
         category = state['category'].lower()
 
-        retriever = vectorstore.as_retriever(
-            search_kwargs={"filter": {"category": category}, "k": 5}
+        # The ticket text doesn't change between review rounds, so its results are retrieved once.
+        # The classifier's intent keywords are added to the query to sharpen the first retrieval.
+        # After a rejection only the retrieve_improve keywords are new, so search just for those.
+        trace_id = _trace_id(state)
+        base_docs = _BASE_DOCS.get(trace_id)
+        queries = []
+        if base_docs is None:
+            queries.append(" ".join([_ticket_text(state), *(state.get('intent_keywords') or [])]))
+        retrieve_improve = state.get('retrieve_improve') or []
+        if retrieve_improve:
+            queries.append(" ".join(retrieve_improve))
+
+        # The queries are independent network calls, so embed them while the vector store is
+        # checked, then run their searches concurrently
+        _, *embeddings = await asyncio.gather(
+            asyncio.to_thread(_try_ensure_rag_index),  # Make sure the vector store has been populated for this process
+            *(aembed_query(query) for query in queries),
         )
-
-        docs = retriever.invoke(query)
-        state['context_docs'] = docs
+        results = list(await asyncio.gather(*(_search_category(embedding, category) for embedding in embeddings)))
+
+        if base_docs is None:
+            base_docs = results.pop(0)
+            _BASE_DOCS[trace_id] = base_docs
+        docs = base_docs
+        if results:
+            seen = {doc.id or doc.page_content for doc in docs}
+            docs = docs + [doc for doc in results[0] if (doc.id or doc.page_content) not in seen]
+
+        docs = docs[:MAX_CONTEXT_DOCS]
+        _CONTEXT_DOCS[trace_id] = docs
         return state
     except ValueError as ve:
-        print(f"ValueError during RAG retrieval: {ve}")
-        state['context_docs'] = [Document(page_content="No relevant documents found.")]
+        logger.error("ValueError during RAG retrieval: %s", ve)
+        _CONTEXT_DOCS[_trace_id(state)] = [Document(page_content="No relevant documents found.")]
         return state
     except Exception as e:
-        print(f"Error during RAG retrieval: {e}")
-        state['context_docs'] = [Document(page_content="No relevant documents found.")]
+        logger.error("Error during RAG retrieval: %s", e)
+        _CONTEXT_DOCS[_trace_id(state)] = [Document(page_content="No relevant documents found.")]
         return state
     
 rag_node_runnable = RunnableLambda(rag_node)
@@ -138,10 +458,10 @@ async def generate_draft(state: State) -> State:
     It uses a language model to create a professional and concise response, incorporating any review feedback if available.
     It updates the state with the generated draft response.
 
-    Note: The function assumes that the 'context_docs' field in the state contains relevant documents for generating the response.
+    Note: The function assumes that rag_node has stored relevant documents for the ticket's 'trace_id'.
     
     Args:
-        state (State): The current state of the support ticket, which includes 'subject', 'description', and 'context_docs'.
+        state (State): The current state of the support ticket, which includes 'subject', 'description', and 'trace_id'.
 
     Raises:
         Exception: If there is an error during the draft generation process.
@@ -150,31 +470,31 @@ async def generate_draft(state: State) -> State:
         State:
     """
     try:
-        print("Generating draft response")
-        llm = get_llm()
-
-        context_text = "\n\n".join([doc.page_content for doc in state['context_docs']])
-
-        prompt = PromptTemplate.from_template(DRAFT_RESPONSE_PROMPT)
-        
-
-        prompt_value = prompt.invoke({
+        logger.info("Generating draft response")
+        docs = _CONTEXT_DOCS.pop(state.get('trace_id'), None)
+        if docs is None:
+            docs = await _recover_context_docs(state)
+        context_text = _compact_context(docs)
+
+        # Stream the draft so callers using graph.astream / astream_events get tokens as they arrive
+        chunks = []
+        async for chunk in _DRAFT_CHAIN.astream({
             "subject": state["subject"],
             "description": state["description"],
             "context": context_text,
-            "review": state.get("feedback",[])
-        })
-
-        response = llm.invoke(prompt_value)
+            "review": _feedback_for_prompt(state)
+        }):
+            chunks.append(chunk.content)
+        response_text = "".join(chunks).strip()
 
         if "draft" not in state or not isinstance(state["draft"], list):
             state["draft"] = []
 
-        state["draft"].append(response.content.strip())
-        print(f"Draft generated: {response.content.strip()}")
+        state["draft"].append(response_text)
+        logger.debug("Draft generated: %s", response_text)
         return state
     except Exception as e:
-        print(f"Error during draft generation: {e}")
+        logger.error("Error during draft generation: %s", e)
         state["draft"] = ["An error occurred while generating the draft response."]
         return state
     
@@ -191,40 +511,36 @@ async def review_draft(state: State) -> State:
         State: 
     """
     try:
-        print("Reviewing draft")
-        llm = get_llm()
+        logger.info("Reviewing draft")
 
         latest_draft = state["draft"][-1] 
-        print(f"Latest draft for review: {latest_draft}")
 
-        prompt = PromptTemplate.from_template(REVIEW_DRAFT_PROMPT)
-        prompt_value = prompt.invoke({"latest_draft": latest_draft, "subject": state["subject"], "description": state["description"]})
-    
-        structured_llm = llm.with_structured_output(ReviewResult)
-        response = structured_llm.invoke(prompt_value)
+        response = await _REVIEW_CHAIN.ainvoke({"latest_draft": latest_draft, "subject": state["subject"], "description": state["description"]})
         if response.feedback is None:
             raise ValueError("Feedback cannot be None. Please provide valid feedback.")
         
-        print(f"Review result: {response.status}, Feedback: {response.feedback}, Keywords: {response.retrive_improve}")
-        print("LLM Raw Response:", response)
-        print("Type of response:", type(response))
+        logger.info("Review result: %s, Feedback: %s, Keywords: %s", response.status, response.feedback, response.retrieve_improve)
         if response.status == "rejected" and response.feedback:
-            state["feedback"].append(response.feedback)
+            _record_feedback(state, response.feedback)
             state["review_count"] = state.get("review_count", 0) + 1
             state['status'] = response.status
-            state['retrive_improve'] = response.retrive_improve or []
+            state['retrieve_improve'] = response.retrieve_improve or []
             
         else:
             state["status"] = "approved"
-            state["feedback"].append("Draft approved by reviewer.")
+            state.setdefault("feedback", []).append("Draft approved by reviewer.")
+            try:
+                await asyncio.to_thread(_store_cached_response, state, latest_draft)
+            except Exception as e:
+                logger.error("Error while caching approved response: %s", e)
             state["review_count"] = state.get("review_count", 0) + 1
-            state['retrive_improve'] = response.retrive_improve or []
+            state['retrieve_improve'] = response.retrieve_improve or []
     except Exception as e:
-        print(f"Error during draft review: {e}")
+        logger.error("Error during draft review: %s", e)
         state["status"] = "rejected" 
-        state["feedback"]= [f"An error occurred during the review process.{e}"]
+        _record_feedback(state, f"An error occurred during the review process.{e}")
         state["review_count"] = state.get("review_count", 0)  + 1
-        state['retrive_improve'] = []
+        state['retrieve_improve'] = []
         
     return state
  
@@ -246,45 +562,33 @@ async def dump_state_to_csv(state: State) -> State:
         State: 
     """
     try:
-        print("Dumping rejected ticket to CSV")
-        os.makedirs("rejected_tickets", exist_ok=True)
+        logger.info("Dumping rejected ticket to CSV")
         filepath = "rejected_tickets/rejected_tickets.csv"
 
-        data = {
-            "timestamp": datetime.datetime.now().isoformat(),
-            "subject": state["subject"],
-            "description": state["description"],
-            "category": state["category"],
-            "drafts": "\n---\n".join(state["draft"]),
-            "feedbacks": "\n---\n".join(state["feedback"]),
-        }
-
-        df = pd.DataFrame([data])
-        if os.path.exists(filepath):
-            df.to_csv(filepath, mode="a", index=False, header=False, encoding="utf-8")
-        else:
-            df.to_csv(filepath, mode="w", index=False, header=True, encoding="utf-8")
+        await asyncio.to_thread(_append_rejected_ticket, filepath, [
+            datetime.datetime.now().isoformat(),
+            state["subject"],
+            state["description"],
+            state["category"],
+            "\n---\n".join(state["draft"]),
+            "\n---\n".join(state["feedback"]),
+        ])
 
-        print(f"Rejected ticket saved to {filepath}")
+        logger.info("Rejected ticket saved to %s", filepath)
         state["review_count"]=0
         return state
     except FileNotFoundError as fnf_error:
-        print(f"File not found error during CSV dump: {fnf_error}")
-        state["status"] = "error"
-        state["feedback"].append("An error occurred while dumping the ticket to CSV.")
-        return state
-    except pd.errors.EmptyDataError as ede:
-        print(f"Empty data error during CSV dump: {ede}")
+        logger.error("File not found error during CSV dump: %s", fnf_error)
         state["status"] = "error"
         state["feedback"].append("An error occurred while dumping the ticket to CSV.")
         return state
     except PermissionError as pe:
-        print(f"Permission error during CSV dump: {pe}")
+        logger.error("Permission error during CSV dump: %s", pe)
         state["status"] = "error"
         state["feedback"].append("An error occurred while dumping the ticket to CSV.")
         return state
     except Exception as e:
-        print(f"Error during CSV dump: {e}")
+        logger.error("Error during CSV dump: %s", e)
         state["status"] = "error"
         state["feedback"].append("An error occurred while dumping the ticket to CSV.")
         return state
@@ -292,30 +596,41 @@ async def dump_state_to_csv(state: State) -> State:
 
 async def format_output(state: State) -> Output:
     """Formats the output based on the review status."""
-    print("Formatting output")
-    
-    if state["status"] == "approved":
-        return Output(message=state["draft"][-1])
-        state.clear()
+    logger.info("Formatting output")
+
+    if state.get("cached_response"):
+        message = state["cached_response"]
+    elif state.get("status") == "approved":
+        message = state["draft"][-1]
     else:
-        return Output(message="A human will review your issue.")
-        state.clear()
+        message = "A human will review your issue."
+
+    # Release the documents kept for this ticket outside the state
+    if state.get("trace_id"):
+        _BASE_DOCS.pop(state["trace_id"], None)
+        _CONTEXT_DOCS.pop(state["trace_id"], None)
 
+    return Output(message=message)
 
-async def route_based_on_review(state: State) -> str:
+
+def route_after_cache_lookup(state: State) -> str:
+    """Routes to format_output on a semantic cache hit, otherwise to classify_ticket."""
+    if state.get("cached_response"):
+        return "format_output"
+    return "classify_ticket"
+
+
+def route_based_on_review(state: State) -> str:
     """Routes the state based on the review status.
 
     If the review status is "approved", it routes to format_output.
-    If the review count is 2 or more, it routes to dump_state.
+    If the review count is _MAX_REVIEWS or more, it routes to dump_state.
     Otherwise, it routes back to retriver for another attempt.
 
     """
-    if state['status'] == "approved":
+    if state["status"] == "approved":
         return "format_output"
-    elif state.get("review_count", 0) >= 2 :
-        return "dump_state"
-    else:
-        return "retriver"
+    return "dump_state" if state.get("review_count", 0) >= _MAX_REVIEWS else "retriver"
 
 
 
@@ -323,6 +638,7 @@ async def route_based_on_review(state: State) -> str:
 
 builder = StateGraph(State, input_schema=Input, output_schema=Output)
 
+builder.add_node("semantic_cache", semantic_cache_lookup)
 builder.add_node("classify_ticket", classify_ticket)
 builder.add_node("retriver", rag_node_runnable)
 builder.add_node("draft", generate_draft)
@@ -330,7 +646,8 @@ builder.add_node("review", review_draft)
 builder.add_node("dump_state", dump_state_to_csv)
 builder.add_node("format_output", format_output)
 
-builder.add_edge(START, "classify_ticket")
+builder.add_edge(START, "semantic_cache")
+builder.add_conditional_edges("semantic_cache", route_after_cache_lookup, ["classify_ticket", "format_output"])
 builder.add_edge("classify_ticket", "retriver")
 builder.add_edge("retriver", "draft")
 builder.add_edge("draft", "review")
@@ -1,15 +1,19 @@
 
 from typing import List, Optional, TypedDict
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing_extensions import Literal
 
+# Valid ticket categories; membership is checked directly instead of through a Literal validator
+CATEGORIES = frozenset({"billing", "technical", "security", "general"})
+
 class Classification(BaseModel):
-    output: Literal["billing", "technical", "security", "general"]
+    output: str = Field(description="One of: billing, technical, security, general")
+    intent_keywords: Optional[List[str]] = None
 
 class ReviewResult(BaseModel):
     status: Literal["approved", "rejected"]
     feedback: Optional[str]
-    retrive_improve: Optional[List[str]]
+    retrieve_improve: Optional[List[str]] = None
 
 class Input(TypedDict):
     subject: str
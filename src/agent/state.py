@@ -1,32 +1,37 @@
 
-from dataclasses import dataclass
-from pydantic import BaseModel
-from dataclasses import dataclass, field
-from typing import Literal, TypedDict, List
+from typing import Literal, Optional, TypedDict, List
 
 
 
-@dataclass(kw_only=True)
 class State(TypedDict):
     """Represents state of our graph.
 
-    Args:
-        TypedDict (_type_): _description_
-        Subject : The subject of support ticket
-        description : The description of our support ticket
-        classification (Literal["Billing", "Technical", "Security", "General"]):
+    Attributes:
+        subject (str): The subject of the support ticket.
+        description (str): The description of the support ticket.
+        category (Literal["billing", "technical", "security", "general"]):
             The classified category of the ticket.
-        context (str): Relevant contextual information retrieved for the ticket.
-        draft_response (str): The drafted response to the user.
-        review_feedback (str): Feedback from the reviewer on the draft.
-        retry_count (int): Number of times the draft has been re-attempted.
+        trace_id (str): Id of the ticket run; retrieved documents are stored under it outside the state.
+        draft (List[str]): Drafted responses to the user, one per review round.
+        review_count (int): Number of review rounds the ticket has been through.
+        feedback (List[str]): Every reviewer feedback, written to the rejected tickets CSV.
+        latest_feedback (str): Most recent reviewer feedback, passed to the draft prompt.
+        prior_feedback_summary (str): Truncated summary of earlier feedback, passed to the draft prompt.
+        status (Literal["approved", "rejected"]): Outcome of the latest review.
+        retrieve_improve (List[str]): Keywords from the reviewer for the next retrieval.
+        cached_response (Optional[str]): Approved response reused from the semantic cache, if any.
+        intent_keywords (List[str]): Keywords returned by the classifier to boost the first retrieval.
     """
     subject: str
     description: str
     category: Literal["billing", "technical", "security", "general"]
-    context_docs:  str
+    trace_id: str
     draft: List[str]
     review_count: int 
     feedback: List[str]
+    latest_feedback: str
+    prior_feedback_summary: str
     status: Literal['approved','rejected']
-    retrive_improve: List[str]
+    retrieve_improve: List[str]
+    cached_response: Optional[str]
+    intent_keywords: List[str]
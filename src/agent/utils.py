@@ -4,13 +4,46 @@ Manage the configuration of various retrievers and utilities.
 This module provides functionality to create and manage LLMs and refresh RAG indexes.
 """
 
+import atexit
+import logging
+import logging.handlers
+import queue
+import sys
+from collections import defaultdict
+from functools import lru_cache
+
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_google_genai.embeddings import GoogleGenerativeAIEmbeddings
-from langchain_postgres.vectorstores import PGVector
-from agent.common import load_and_split_documents, POSTGRES_CONNECTION_STRING, GOOGLE_API_KEY
+from agent.common import category_collection, create_vector_index, ingest_documents, invalidate_local_index, load_and_split_documents, GOOGLE_API_KEY
+
+logger = logging.getLogger(__name__)
+
+@lru_cache(maxsize=1)
+def configure_logging(level: int = logging.INFO) -> None:
+    """
+    Route the agent's log records through a queue so writes to stdout happen on a background thread.
+
+    Meant to be called by an entrypoint that has no logging setup of its own; importing the graph
+    doesn't call it. Only the "agent" package logger is configured, once per process, and records
+    still propagate to the root logger. If the root logger already has handlers, the host owns the
+    output and only the level is set.
+    """
+    package_logger = logging.getLogger("agent")
+    package_logger.setLevel(level)
+    if logging.getLogger().handlers:
+        return
 
+    log_queue: queue.Queue = queue.Queue(-1)
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    listener.start()
+    atexit.register(listener.stop)
+
+    package_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+
+@lru_cache(maxsize=1)
 def get_llm() -> ChatGoogleGenerativeAI:
-    """Factory method to return a new LLM instance per request."""
+    """Return the process-wide LLM instance, created on first use and shared by all nodes."""
     return ChatGoogleGenerativeAI(
         model="gemini-2.0-flash",
         temperature=0,
@@ -22,11 +55,18 @@ def refresh_rag(dataset_path: str = "static/dataset"):
     Loads documents, splits them, and refreshes the PGVector index.
     """
     docs = load_and_split_documents(dataset_path)
-    embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-    PGVector.from_documents(
-        documents=docs,
-        embedding=embeddings,
-        collection_name="support_docs",
-        connection=POSTGRES_CONNECTION_STRING,
-    )
-    print("RAG documents loaded and indexed successfully.")
\ No newline at end of file
+
+    # Each category gets its own collection so retrieval never has to filter on metadata
+    docs_by_category = defaultdict(list)
+    for doc in docs:
+        docs_by_category[doc.metadata["category"]].append(doc)
+
+    for category, category_docs in docs_by_category.items():
+        collection_name = category_collection(category)
+        ingest_documents(category_docs, collection_name=collection_name)
+        try:
+            create_vector_index(collection_name)
+        except Exception as e:
+            logger.warning("Could not create vector index for %s: %s", collection_name, e)
+    invalidate_local_index()
+    logger.info("RAG documents loaded and indexed successfully.")
\ No newline at end of file
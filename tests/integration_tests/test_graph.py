@@ -1,21 +1,27 @@
+import asyncio
+import csv
+import datetime
+import sys
+import threading
 import pytest
 import os
 from pathlib import Path
+from langchain.schema import Document
 from agent.state import State
-from agent.graph import dump_state_to_csv, route_based_on_review
+from agent.graph import _compact_context, _fast_classify, _feedback_for_prompt, _record_feedback, dump_state_to_csv, route_after_cache_lookup, route_based_on_review
 
 @pytest.fixture
 def sample_state():
-    return State(
-        subject="Test ticket",
-        description="This is a test description",
-        category="technical",
-        context_docs=[],
-        draft=[],
-        feedback=[],
-        review_count=0,
-        status="pending"
-    )
+    state: State = {
+        "subject": "Test ticket",
+        "description": "This is a test description",
+        "category": "technical",
+        "draft": [],
+        "feedback": [],
+        "review_count": 0,
+        "status": "pending",
+    }
+    return state
 
 def test_route_based_on_review_approved(sample_state):
     sample_state["status"] = "approved"
@@ -41,3 +47,203 @@ def test_route_based_on_review_zero_reviews(sample_state):
     result = route_based_on_review(sample_state)
     assert result == "retriver"
 
+def test_route_after_cache_lookup_hit(sample_state):
+    sample_state["cached_response"] = "Cached answer"
+    result = route_after_cache_lookup(sample_state)
+    assert result == "format_output"
+
+def test_route_after_cache_lookup_miss(sample_state):
+    sample_state["cached_response"] = None
+    result = route_after_cache_lookup(sample_state)
+    assert result == "classify_ticket"
+
+def test_compact_context_dedupes_and_truncates():
+    docs = [
+        Document(page_content="a" * 10),
+        Document(page_content="a" * 10),
+        Document(page_content="b" * 10),
+        Document(page_content="c" * 10),
+    ]
+    result = _compact_context(docs, per_doc_chars=8, total_chars=12)
+    assert result == "a" * 8 + "\n\n" + "b" * 4
+
+def test_fast_classify_only_for_unambiguous_tickets():
+    assert _fast_classify("App crashes when I upload a file") == ("technical", ["crashes", "upload"])
+    assert _fast_classify("I was charged twice and the app crashes") is None
+    assert _fast_classify("How do I update my profile?") is None
+
+def test_dump_state_to_csv_after_two_reviews(sample_state, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    sample_state["status"] = "rejected"
+    sample_state["review_count"] = 2
+    sample_state["draft"] = ["Draft 1", "Draft 2"]
+    sample_state["feedback"] = ["Feedback 1", "Feedback 2"]
+
+    async def dump_concurrently():
+        return await asyncio.gather(dump_state_to_csv(sample_state), dump_state_to_csv(dict(sample_state)))
+
+    result, _ = asyncio.run(dump_concurrently())
+
+    assert result["review_count"] == 0
+    csv_path = Path("rejected_tickets") / "rejected_tickets.csv"
+    assert os.path.exists(csv_path)
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == ["timestamp", "subject", "description", "category", "drafts", "feedbacks"]
+    assert len(rows) == 3
+    assert rows[1][4] == "Draft 1\n---\nDraft 2"
+    assert rows[1][5] == "Feedback 1\n---\nFeedback 2"
+
+def test_ensure_rag_index_ingests_once_and_backs_off_after_failure(monkeypatch):
+    graph_module = sys.modules["agent.graph"]
+    calls = []
+
+    def fake_refresh_rag():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("database down")
+
+    monkeypatch.setattr(graph_module, "refresh_rag", fake_refresh_rag)
+    monkeypatch.setattr(graph_module, "_rag_index_ready", False)
+    monkeypatch.setattr(graph_module, "_rag_index_failed_at", None)
+
+    with pytest.raises(RuntimeError):
+        graph_module._ensure_rag_index()
+    with pytest.raises(RuntimeError):
+        graph_module._ensure_rag_index()
+    assert len(calls) == 1
+
+    monkeypatch.setattr(graph_module, "_rag_index_failed_at", None)
+    threads = [threading.Thread(target=graph_module._ensure_rag_index) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 2
+
+def test_ticket_docs_evicts_oldest_tickets(monkeypatch):
+    graph_module = sys.modules["agent.graph"]
+    monkeypatch.setattr(graph_module, "MAX_TRACKED_TICKETS", 2)
+    docs = graph_module._TicketDocs()
+    for trace_id in ("a", "b", "c"):
+        docs[trace_id] = [Document(page_content=trace_id)]
+    assert list(docs) == ["b", "c"]
+
+@pytest.mark.parametrize("distance, age_days, expected", [
+    (0.03, 0, "Cached answer"),
+    (0.10, 0, None),
+    (0.03, 30, None),
+])
+def test_semantic_cache_lookup_threshold_and_age(sample_state, monkeypatch, distance, age_days, expected):
+    graph_module = sys.modules["agent.graph"]
+    ts = (datetime.datetime.now() - datetime.timedelta(days=age_days)).isoformat()
+
+    class FakeStore:
+        def similarity_search_with_score_by_vector(self, embedding, k=1):
+            return [(Document(page_content="ticket", metadata={"message": "Cached answer", "ts": ts}), distance)]
+
+    async def fake_aembed_query(text):
+        return [1.0, 0.0]
+
+    monkeypatch.setattr(graph_module, "get_vectorstore", lambda *args: FakeStore())
+    monkeypatch.setattr(graph_module, "aembed_query", fake_aembed_query)
+
+    result = asyncio.run(graph_module.semantic_cache_lookup(sample_state))
+    assert result["cached_response"] == expected
+
+def test_record_feedback_keeps_latest_and_bounded_summary(sample_state):
+    _record_feedback(sample_state, "Feedback 1")
+    assert _feedback_for_prompt(sample_state) == "Feedback 1"
+
+    _record_feedback(sample_state, "Feedback 2")
+    assert sample_state["latest_feedback"] == "Feedback 2"
+    assert sample_state["prior_feedback_summary"] == "Feedback 1"
+    assert _feedback_for_prompt(sample_state) == "Feedback 2\nEarlier feedback: Feedback 1"
+
+    _record_feedback(sample_state, "x" * 600)
+    _record_feedback(sample_state, "Feedback 4")
+    assert len(sample_state["prior_feedback_summary"]) == 500
+    assert sample_state["prior_feedback_summary"].endswith("x" * 100)
+    assert sample_state["feedback"] == ["Feedback 1", "Feedback 2", "x" * 600, "Feedback 4"]
+
+def test_review_draft_first_round_approval_is_cached(monkeypatch):
+    graph_module = sys.modules["agent.graph"]
+    stored = []
+
+    class FakeReviewChain:
+        async def ainvoke(self, inputs):
+            return graph_module.ReviewResult(status="approved", feedback="Looks good", retrieve_improve=None)
+
+    monkeypatch.setattr(graph_module, "_REVIEW_CHAIN", FakeReviewChain())
+    monkeypatch.setattr(graph_module, "_store_cached_response", lambda state, message: stored.append(message))
+    state = {"subject": "Test ticket", "description": "This is a test description", "draft": ["Draft 1"]}
+
+    result = asyncio.run(graph_module.review_draft(state))
+
+    assert result["status"] == "approved"
+    assert result["feedback"] == ["Draft approved by reviewer."]
+    assert stored == ["Draft 1"]
+
+def test_generate_draft_searches_again_when_context_is_missing(sample_state, monkeypatch):
+    graph_module = sys.modules["agent.graph"]
+    prompts = []
+
+    class FakeChunk:
+        content = "Draft text"
+
+    class FakeDraftChain:
+        async def astream(self, inputs):
+            prompts.append(inputs)
+            yield FakeChunk()
+
+    async def fake_aembed_query(text):
+        return [1.0, 0.0]
+
+    async def fake_search_category(query_embedding, category, k=5):
+        return [Document(page_content="Refund policy")]
+
+    monkeypatch.setattr(graph_module, "_DRAFT_CHAIN", FakeDraftChain())
+    monkeypatch.setattr(graph_module, "aembed_query", fake_aembed_query)
+    monkeypatch.setattr(graph_module, "_search_category", fake_search_category)
+    sample_state["trace_id"] = "evicted-ticket"
+
+    result = asyncio.run(graph_module.generate_draft(sample_state))
+
+    assert prompts[0]["context"] == "Refund policy"
+    assert result["draft"] == ["Draft text"]
+
+def test_search_category_falls_back_when_quantized_search_fails(monkeypatch):
+    graph_module = sys.modules["agent.graph"]
+
+    def failing_quantized_search(*args):
+        raise RuntimeError('type "halfvec" does not exist')
+
+    monkeypatch.setattr(graph_module, "local_similarity_search", lambda *args: [])
+    monkeypatch.setattr(graph_module, "VECTOR_INDEX_PRECISION", "halfvec")
+    monkeypatch.setattr(graph_module, "quantized_similarity_search", failing_quantized_search)
+    monkeypatch.setattr(graph_module, "_pgvector_search", lambda *args: [Document(page_content="FP32 match")])
+
+    docs = asyncio.run(graph_module._search_category([1.0, 0.0], "security"))
+
+    assert [doc.page_content for doc in docs] == ["FP32 match"]
+
+def test_rag_node_searches_existing_collections_when_ingest_fails(sample_state, monkeypatch):
+    graph_module = sys.modules["agent.graph"]
+
+    def failing_ensure_rag_index():
+        raise RuntimeError("Dataset ingest failed recently, not retrying yet.")
+
+    async def fake_aembed_query(text):
+        return [1.0, 0.0]
+
+    async def fake_search_category(query_embedding, category, k=5):
+        return [Document(page_content="Stored document")]
+
+    monkeypatch.setattr(graph_module, "_ensure_rag_index", failing_ensure_rag_index)
+    monkeypatch.setattr(graph_module, "aembed_query", fake_aembed_query)
+    monkeypatch.setattr(graph_module, "_search_category", fake_search_category)
+
+    result = asyncio.run(graph_module.rag_node(sample_state))
+
+    assert graph_module._CONTEXT_DOCS.pop(result["trace_id"]) == [Document(page_content="Stored document")]
+    graph_module._BASE_DOCS.pop(result["trace_id"], None)
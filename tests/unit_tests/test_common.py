@@ -1,7 +1,8 @@
 import pytest
 from pathlib import Path
 from langchain.schema import Document
-from agent.common import load_and_split_documents
+from agent import common
+from agent.common import embed_query, ingest_documents, load_and_split_documents, local_similarity_search
 
 def test_load_and_split_documents(tmp_path):
     # Create a temporary text file with sample content
@@ -27,4 +28,93 @@ def test_load_and_split_documents(tmp_path):
 
 def test_load_and_split_documents_empty(tmp_path):
     documents = load_and_split_documents(str(tmp_path))
-    assert documents == []
\ No newline at end of file
+    assert documents == []
+
+def test_embed_query_reuses_cached_embedding(monkeypatch):
+    calls = []
+
+    class FakeEmbeddings:
+        def embed_query(self, text):
+            calls.append(text)
+            return [0.1, 0.2]
+
+    monkeypatch.setattr(common, "get_embeddings", lambda: FakeEmbeddings())
+    monkeypatch.setattr(common, "_embed_cache", common.OrderedDict())
+
+    assert embed_query("Login failure") == [0.1, 0.2]
+    assert embed_query("  login   FAILURE ") == [0.1, 0.2]
+    assert calls == ["login failure"]
+
+def test_local_similarity_search_orders_by_cosine(monkeypatch):
+    docs = [Document(page_content=text) for text in ("x axis", "y axis", "diagonal")]
+    matrix = common.np.array([[1.0, 0.0], [0.0, 1.0], [0.7071, 0.7071]], dtype=common.np.float32)
+    monkeypatch.setattr(common, "_load_local_index", lambda category: (matrix, docs))
+    monkeypatch.setattr(common, "_local_indexes", {})
+
+    results = local_similarity_search([2.0, 0.1], "billing", k=2)
+
+    assert [doc.page_content for doc in results] == ["x axis", "diagonal"]
+
+def test_local_similarity_search_skips_categories_without_local_index(monkeypatch):
+    def fail_load(category):
+        raise AssertionError("index should not be loaded")
+
+    monkeypatch.setattr(common, "_load_local_index", fail_load)
+    monkeypatch.setattr(common, "LOCAL_INDEX_CATEGORIES", frozenset({"billing"}))
+
+    assert local_similarity_search([1.0, 0.0], "security") == []
+
+def test_local_index_loads_once_until_invalidated(monkeypatch):
+    loads = []
+    matrix = common.np.array([[1.0, 0.0]], dtype=common.np.float32)
+
+    def fake_load(category):
+        loads.append(category)
+        return matrix, [Document(page_content="x axis")]
+
+    monkeypatch.setattr(common, "_load_local_index", fake_load)
+    monkeypatch.setattr(common, "_local_indexes", {})
+
+    local_similarity_search([1.0, 0.0], "billing")
+    local_similarity_search([1.0, 0.0], "billing")
+    common.invalidate_local_index()
+    local_similarity_search([1.0, 0.0], "billing")
+
+    assert loads == ["billing", "billing"]
+
+def test_rerank_rows_orders_by_exact_cosine():
+    class Row:
+        def __init__(self, id, embedding):
+            self.id = id
+            self.document = f"doc {id}"
+            self.cmetadata = {}
+            self.embedding = embedding
+
+    rows = [Row(1, [0.0, 1.0]), Row(2, [10.0, 1.0]), Row(3, [1.0, 1.0]), Row(4, [-1.0, 0.0])]
+
+    results = common._rerank_rows(rows, common.np.array([1.0, 0.0], dtype=common.np.float32), k=3)
+
+    assert [doc.id for doc in results] == ["2", "3", "1"]
+
+def test_ingest_documents_embeds_in_batches(monkeypatch):
+    embed_calls = []
+    added = []
+
+    class FakeEmbeddings:
+        def embed_documents(self, texts):
+            embed_calls.append(list(texts))
+            return [[0.0] for _ in texts]
+
+    class FakeStore:
+        embeddings = FakeEmbeddings()
+
+        def add_embeddings(self, texts, embeddings, metadatas, ids):
+            added.extend(ids)
+
+    monkeypatch.setattr(common, "get_vectorstore", lambda *args: FakeStore())
+    docs = [Document(id=f"billing-{i}", page_content=f"entry {i}", metadata={}) for i in range(5)]
+
+    ingest_documents(docs, batch_size=2)
+
+    assert [len(batch) for batch in embed_calls] == [2, 2, 1]
+    assert added == [doc.id for doc in docs]
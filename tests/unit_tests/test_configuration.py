@@ -1,9 +1,14 @@
 from langgraph.pregel import Pregel
 
 from agent.graph import graph
+from agent.utils import get_llm
 
 
 def test_placeholder() -> None:
     # TODO: You can add actual unit tests
     # for your graph and other logic here.
     assert isinstance(graph, Pregel)
+
+
+def test_get_llm_returns_shared_instance() -> None:
+    assert get_llm() is get_llm()